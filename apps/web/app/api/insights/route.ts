@@ -1,3 +1,6 @@
+import fs from "fs";
+import path from "path";
+import zlib from "zlib";
 import { NextRequest, NextResponse } from "next/server";
 import { prisma } from "../../../lib/prisma";
 
@@ -9,6 +12,29 @@ function clamp(n: number, lo: number, hi: number) {
   return Math.max(lo, Math.min(hi, n));
 }
 
+// Preset (days, level) payloads precomputed by scripts/build_insights.py:
+// public/data/<sector>/insights/<companyId>.json.gz
+function readSnapshot(sector: string, companyId: string, days: number, level: Level) {
+  if (!/^[A-Za-z0-9][A-Za-z0-9._-]*$/.test(companyId)) return null;
+  const p = path.join(process.cwd(), "public", "data", sector, "insights", `${companyId}.json.gz`);
+  try {
+    const snap = JSON.parse(zlib.gunzipSync(fs.readFileSync(p)).toString("utf-8"));
+    const w = snap?.windows?.[String(days)];
+    const l = w?.levels?.[level];
+    if (!w || !l) return null;
+    return {
+      asOf: snap.asOf,
+      topCpc: l.topCpc,
+      cpcTrend: l.cpcTrend,
+      competitors: w.competitors,
+      coAssignees: w.coAssignees,
+      topInventors: w.topInventors,
+    };
+  } catch {
+    return null;
+  }
+}
+
 export async function GET(req: NextRequest) {
   try {
     const { searchParams } = new URL(req.url);
@@ -28,6 +54,17 @@ export async function GET(req: NextRequest) {
       return NextResponse.json({ error: "Invalid level" }, { status: 400 });
     }
 
+    // Common case: a preset window served from the static snapshot, no database work
+    const snapshot = readSnapshot(sector, companyId, days, level);
+    if (snapshot) {
+      return NextResponse.json(
+        { sector, companyId, days, level, ...snapshot },
+        {
+          headers: { "Cache-Control": "s-maxage=3600, stale-while-revalidate=86400" },
+        }
+      );
+    }
+
     // Controlled rollup expression (safe, no user SQL injection)
     const rollExpr =
       level === "group"
@@ -81,7 +118,9 @@ export async function GET(req: NextRequest) {
 
     const topCpc = await prisma.$queryRawUnsafe<any[]>(topCpcSql, sector, companyId, days);
 
-    // CPC trend: compare current window vs previous window
+    // CPC trend: compare current window vs previous window. Grouped by the rolled code
+    // (GROUP BY 1; a bare "code" would bind to the raw column) with pct as a number, the
+    // same shape as the snapshots' cpcTrend.
     const trendSql = `
       WITH cur AS (
         SELECT (${rollExpr}) AS code, COUNT(*)::int AS n
@@ -93,7 +132,7 @@ export async function GET(req: NextRequest) {
             AND p.cpc_group_ids <> ''
         ) x
         WHERE code IS NOT NULL AND code <> ''
-        GROUP BY code
+        GROUP BY 1
       ),
       prev AS (
         SELECT (${rollExpr}) AS code, COUNT(*)::int AS n
@@ -106,7 +145,7 @@ export async function GET(req: NextRequest) {
             AND p.cpc_group_ids <> ''
         ) y
         WHERE code IS NOT NULL AND code <> ''
-        GROUP BY code
+        GROUP BY 1
       ),
       joined AS (
         SELECT
@@ -122,7 +161,7 @@ export async function GET(req: NextRequest) {
         j.prev_n,
         j.cur_n,
         (j.cur_n - j.prev_n) AS delta,
-        CASE WHEN j.prev_n = 0 THEN NULL ELSE ROUND((100.0 * (j.cur_n - j.prev_n) / j.prev_n)::numeric, 2) END AS pct
+        CASE WHEN j.prev_n = 0 THEN NULL ELSE ROUND((100.0 * (j.cur_n - j.prev_n) / j.prev_n)::numeric, 2)::float8 END AS pct
       FROM joined j
       ${titleJoin.replace("rolled.code", "j.code")}
       WHERE j.cur_n > 0 OR j.prev_n > 0
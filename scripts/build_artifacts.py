@@ -1,12 +1,16 @@
 from __future__ import annotations
 
-import glob
 import json
 import os
 from dataclasses import dataclass
-from typing import List
+from datetime import date
+from typing import Dict, List, Set, Tuple
 
 import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from partition_stats import ensure_partition_stats, merge_partition_stats
+from store import filter_window, load_partitioned_store, load_year
 
 
 @dataclass(frozen=True)
@@ -15,6 +19,9 @@ class BuildConfig:
     store_dir: str              # data/store/<sector>/
     out_public_dir: str         # apps/web/public/data/<sector>/
     out_pg_dir: str             # data/state/postgres/
+    top_n: int = 200            # tracked companies per sector
+    stats_window_years: Tuple[int, ...] = (1, 3)  # extra companies_<n>y.json trailing windows
+    window_start: str = ""      # ISO date; only patents granted after it are aggregated/exported
 
 
 def _safe_int(x) -> int:
@@ -24,22 +31,7 @@ def _safe_int(x) -> int:
         return 0
 
 
-def _load_store(store_dir: str, prefix: str) -> pd.DataFrame:
-    files = sorted(glob.glob(os.path.join(store_dir, f"{prefix}_*.csv")))
-    if not files:
-        return pd.DataFrame()
-    parts = [pd.read_csv(f, dtype=str) for f in files]
-    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
-
-
-def build_sector_artifacts(cfg: BuildConfig) -> None:
-    os.makedirs(cfg.out_public_dir, exist_ok=True)
-    os.makedirs(cfg.out_pg_dir, exist_ok=True)
-
-    pairs = _load_store(cfg.store_dir, "pairs")
-    if pairs.empty:
-        raise RuntimeError(f"No pairs store found under {cfg.store_dir}")
-
+def corporate_pairs(pairs: pd.DataFrame) -> pd.DataFrame:
     # Keep only corporations/companies as "tracked companies"
     pairs["assignee_type"] = pairs.get("assignee_type", "").fillna("").astype(str)
     corp = pairs[pairs["assignee_type"] == "2"].copy()
@@ -62,7 +54,10 @@ def build_sector_artifacts(cfg: BuildConfig) -> None:
     corp["cited_by"] = corp["patent_num_times_cited_by_us_patents"].fillna("0").map(_safe_int)
     corp["patent_date"] = corp["patent_date"].fillna("").astype(str)
     corp["patent_year"] = corp["patent_date"].str.slice(0, 4).map(lambda x: _safe_int(x) if x else 0)
+    return corp
 
+
+def compute_company_stats(corp: pd.DataFrame) -> pd.DataFrame:
     # Company ranking criterion: patent count (stable)
     company_stats = (
         corp.groupby(["canonical_company_id", "display_name"], dropna=False)
@@ -94,12 +89,45 @@ def build_sector_artifacts(cfg: BuildConfig) -> None:
     )
     company_stats = company_stats.merge(breadth, on="canonical_company_id", how="left")
     company_stats["cpcBreadth"] = company_stats["cpcBreadth"].fillna(0).astype(int)
+    return company_stats
 
-    # Top 200 by patentCount
-    top = company_stats.sort_values(["patentCount", "totalCitations"], ascending=[False, False]).head(200).copy()
-    top_ids = set(top["canonical_company_id"].astype(str))
 
-    # Write companies.json for the UI
+def select_top_companies(company_stats: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return company_stats.sort_values(["patentCount", "totalCitations"], ascending=[False, False]).head(top_n).copy()
+
+
+def top_company_ids(pairs: pd.DataFrame, top_n: int) -> Set[str]:
+    """
+    The tracked-company set exactly as build_sector_artifacts will choose it.
+    Used by the fetch stage to decide which patents need inventor details.
+    """
+    if pairs.empty:
+        return set()
+    top = select_top_companies(compute_company_stats(corporate_pairs(pairs)), top_n)
+    return set(top["canonical_company_id"].astype(str))
+
+
+def window_year_stats(store_dir: str, window_start: str, persist: bool = True) -> Dict[int, pd.DataFrame]:
+    """Per-year company stats of the window, served from the partition sidecars."""
+    return ensure_partition_stats(
+        store_dir,
+        lambda year: corporate_pairs(filter_window(load_year(store_dir, "pairs", year), window_start)),
+        min_date=window_start,
+        persist=persist,
+    )
+
+
+def tracked_companies(store_dir: str, window_start: str, top_n: int, persist: bool = True) -> pd.DataFrame:
+    """The tracked companies (stats rows) the build publishes, from the sidecars instead of the rows."""
+    stats = merge_partition_stats(list(window_year_stats(store_dir, window_start, persist=persist).values()))
+    return select_top_companies(stats, top_n)
+
+
+def tracked_company_ids(store_dir: str, window_start: str, top_n: int) -> Set[str]:
+    return set(tracked_companies(store_dir, window_start, top_n)["canonical_company_id"].astype(str))
+
+
+def _write_companies_json(top: pd.DataFrame, path: str) -> None:
     companies_out = top.rename(
         columns={
             "canonical_company_id": "companyId",
@@ -109,9 +137,47 @@ def build_sector_artifacts(cfg: BuildConfig) -> None:
         ["companyId", "displayName", "patentCount", "totalCitations", "citationsPerPatent", "cpcBreadth"]
     ].to_dict(orient="records")
 
-    with open(os.path.join(cfg.out_public_dir, "companies.json"), "w", encoding="utf-8") as f:
+    with open(path, "w", encoding="utf-8") as f:
         json.dump(companies_out, f, indent=2)
 
+
+def build_sector_artifacts(cfg: BuildConfig) -> None:
+    os.makedirs(cfg.out_public_dir, exist_ok=True)
+    os.makedirs(cfg.out_pg_dir, exist_ok=True)
+
+    pairs = load_partitioned_store(cfg.store_dir, "pairs", min_date=cfg.window_start)
+    if pairs.empty:
+        raise RuntimeError(f"No pairs store found under {cfg.store_dir}")
+
+    corp = corporate_pairs(pairs)
+
+    # Company stats come from per-year sidecars; only years that gained segments since
+    # the last build are re-aggregated.
+    year_stats = window_year_stats(cfg.store_dir, cfg.window_start)
+    company_stats = merge_partition_stats(list(year_stats.values()))
+
+    # Top N by patentCount
+    top = select_top_companies(company_stats, cfg.top_n)
+    top_ids = set(top["canonical_company_id"].astype(str))
+
+    # Write companies.json for the UI
+    _write_companies_json(top, os.path.join(cfg.out_public_dir, "companies.json"))
+
+    # Trailing N-year windows (granted after today - N years): whole years reuse the shared
+    # sidecars, only each window's boundary year is trimmed into a sidecar of its own.
+    for n in cfg.stats_window_years:
+        cutoff = max(cfg.window_start, (date.today() - relativedelta(years=n)).isoformat())
+        window_stats = ensure_partition_stats(
+            cfg.store_dir,
+            lambda year, cutoff=cutoff: corporate_pairs(filter_window(load_year(cfg.store_dir, "pairs", year), cutoff)),
+            min_date=cutoff,
+            tag=f"{n}y",
+        )
+        _write_companies_json(
+            select_top_companies(merge_partition_stats(list(window_stats.values())), cfg.top_n),
+            os.path.join(cfg.out_public_dir, f"companies_{n}y.json"),
+        )
+
     # ---------- Postgres exports ----------
     # Filter to tracked companies
     patents_df = corp[corp["canonical_company_id"].astype(str).isin(top_ids)].copy()
@@ -124,8 +190,8 @@ def build_sector_artifacts(cfg: BuildConfig) -> None:
     patents_df["cpc_subclass_ids"] = patents_df["cpc_subclass_ids"].fillna("").astype(str)
     patents_df["cpc_group_ids"] = patents_df["cpc_group_ids"].fillna("").astype(str)
 
-    # Deduplicate to unique company/patent
-    patents_df = patents_df.sort_values(["patent_date", "patent_id"]).drop_duplicates(
+    # Deduplicate to unique company/patent; a total, stable order keeps weekly diffs small
+    patents_df = patents_df.sort_values(["patent_date", "patent_id", "company_id"], kind="mergesort").drop_duplicates(
         subset=["sector", "company_id", "patent_id"], keep="last"
     )
 
@@ -165,7 +231,7 @@ def build_sector_artifacts(cfg: BuildConfig) -> None:
     pg_companies.to_csv(os.path.join(cfg.out_pg_dir, f"{cfg.sector_id}_companies.csv"), index=False)
 
     # Inventors export for top companies
-    inventors = _load_store(cfg.store_dir, "inventors")
+    inventors = load_partitioned_store(cfg.store_dir, "inventors", min_date=cfg.window_start)
     if not inventors.empty:
         for col in [
             "sector_id",
@@ -184,6 +250,7 @@ def build_sector_artifacts(cfg: BuildConfig) -> None:
         inventors["sector"] = cfg.sector_id
         inventors["company_id"] = inventors["canonical_company_id"].astype(str)
         inventors = inventors.drop_duplicates(subset=["sector", "company_id", "patent_id", "inventor_id"])
+        inventors = inventors.sort_values(["company_id", "patent_id", "inventor_id"], kind="mergesort")
 
         pg_inventors = inventors.reindex(
             columns=[
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import glob
+import gzip
+import json
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Presets offered by CompanyInsights.tsx; anything else falls back to the live API queries.
+INSIGHT_DAYS: Tuple[int, ...] = (90, 180, 365, 730, 1825)
+INSIGHT_LEVELS: Tuple[str, ...] = ("group", "main_group", "subclass", "class")
+
+# Same limits as apps/web/app/api/insights/route.ts
+TOP_CPC_LIMIT = 20
+TREND_LIMIT = 20
+COMPETITOR_GROUPS = 6
+COMPETITORS_LIMIT = 15
+CO_ASSIGNEES_LIMIT = 15
+INVENTORS_LIMIT = 15
+
+
+def _cutoff(as_of: date, days: int) -> str:
+    return (as_of - timedelta(days=days)).isoformat()
+
+
+def roll_codes(codes: pd.Series, level: str) -> pd.Series:
+    """
+    Mirrors the SQL rollup expression for a CPC level. Categorical codes (see query_store)
+    are rolled once per dictionary entry and stay categorical, with sorted categories.
+    """
+    if level == "group":
+        return codes
+    if isinstance(codes.dtype, pd.CategoricalDtype):
+        rolled, uniques = pd.factorize(roll_codes(pd.Series(codes.cat.categories, dtype=object), level), sort=True)
+        idx = codes.cat.codes.to_numpy()
+        mapped = np.where(idx >= 0, rolled[idx], -1)
+        return pd.Series(pd.Categorical.from_codes(mapped, categories=uniques), index=codes.index, name=codes.name)
+    if level == "main_group":
+        return codes.str.split("/", n=1).str[0] + "/00"
+    if level == "subclass":
+        return codes.str.slice(0, 4)
+    if level == "class":
+        return codes.str.slice(0, 3)
+    raise ValueError(f"Invalid level: {level}")
+
+
+def explode_groups(patents: pd.DataFrame) -> pd.DataFrame:
+    """One row per (company_id, patent_id, patent_date, code) from cpc_group_ids."""
+    df = patents[["company_id", "patent_id", "patent_date", "cpc_group_ids"]].copy()
+    df = df[df["cpc_group_ids"].fillna("") != ""]
+    df["code"] = df["cpc_group_ids"].str.split("|")
+    df = df.explode("code").drop(columns=["cpc_group_ids"])
+    return df[df["code"].fillna("") != ""].reset_index(drop=True)
+
+
+def _top_per_company(df: pd.DataFrame, by: List[str], ascending: List[bool], limit: int) -> pd.DataFrame:
+    return df.sort_values(["company_id"] + by, ascending=[True] + ascending).groupby("company_id").head(limit)
+
+
+def _title_col(df: pd.DataFrame, titles: Dict[str, str]) -> pd.Series:
+    return df["code"].astype(str).map(titles).fillna("")
+
+
+def top_cpc(exploded: pd.DataFrame, as_of: date, days: int, level: str, titles: Dict[str, str]) -> pd.DataFrame:
+    cur = exploded[exploded["patent_date"] >= _cutoff(as_of, days)]
+    counts = (
+        cur.assign(code=roll_codes(cur["code"], level))
+        .groupby(["company_id", "code"], observed=True)
+        .size()
+        .reset_index(name="n")
+    )
+    counts["title"] = _title_col(counts, titles)
+    return _top_per_company(counts, ["n", "code"], [False, True], TOP_CPC_LIMIT)[["company_id", "code", "title", "n"]]
+
+
+def cpc_trend(exploded: pd.DataFrame, as_of: date, days: int, level: str, titles: Dict[str, str]) -> pd.DataFrame:
+    cut = _cutoff(as_of, days)
+    prev_cut = _cutoff(as_of, days * 2)
+
+    rolled = exploded.assign(code=roll_codes(exploded["code"], level))
+    cur = rolled[rolled["patent_date"] >= cut].groupby(["company_id", "code"], observed=True).size().rename("cur_n")
+    prev = (
+        rolled[(rolled["patent_date"] < cut) & (rolled["patent_date"] >= prev_cut)]
+        .groupby(["company_id", "code"], observed=True)
+        .size()
+        .rename("prev_n")
+    )
+    j = prev.reset_index().merge(cur.reset_index(), on=["company_id", "code"], how="outer")
+    j[["prev_n", "cur_n"]] = j[["prev_n", "cur_n"]].fillna(0).astype(int)
+    j = j[(j["cur_n"] > 0) | (j["prev_n"] > 0)]
+    j["delta"] = j["cur_n"] - j["prev_n"]
+    j["pct"] = (100.0 * j["delta"] / j["prev_n"].where(j["prev_n"] != 0)).round(2)
+    j["title"] = _title_col(j, titles)
+    top = _top_per_company(j, ["delta", "cur_n", "code"], [False, False, True], TREND_LIMIT)
+    return top[["company_id", "code", "title", "prev_n", "cur_n", "delta", "pct"]]
+
+
+def _group_patents(exploded: pd.DataFrame, as_of: date, days: int) -> pd.DataFrame:
+    cur = exploded[exploded["patent_date"] >= _cutoff(as_of, days)]
+    per_code = cur.drop_duplicates(["company_id", "patent_id", "code"]).groupby(["company_id", "code"], observed=True).size()
+    return per_code.reset_index(name="n")
+
+
+def competitor_groups(exploded: pd.DataFrame, as_of: date, days: int) -> pd.DataFrame:
+    """Each company's top CPC groups by in-window patents; competitor overlap is scored on these."""
+    per_code = _group_patents(exploded, as_of, days)
+    return _top_per_company(per_code, ["n", "code"], [False, True], COMPETITOR_GROUPS)[["company_id", "code"]]
+
+
+def competitors(exploded: pd.DataFrame, as_of: date, days: int, names: Dict[str, str]) -> pd.DataFrame:
+    """Overlap on each company's top CPC groups (always detailed group codes)."""
+    per_code = _group_patents(exploded, as_of, days)
+
+    top_groups = _top_per_company(per_code, ["n", "code"], [False, True], COMPETITOR_GROUPS)[["company_id", "code"]]
+    others = per_code.rename(columns={"company_id": "other_company_id", "n": "overlap"})
+    m = top_groups.merge(others, on="code")
+    m = m[m["company_id"] != m["other_company_id"]]
+
+    agg = m.groupby(["company_id", "other_company_id"])["overlap"].sum().reset_index(name="score")
+    agg = agg.sort_values(["company_id", "score", "other_company_id"], ascending=[True, False, True])
+    agg = agg.groupby("company_id").head(COMPETITORS_LIMIT)
+    agg["display_name"] = agg["other_company_id"].map(names).fillna(agg["other_company_id"])
+    agg = agg.sort_values(["company_id", "score", "display_name"], ascending=[True, False, True])
+    return agg.rename(columns={"other_company_id": "competitor_id"})[["company_id", "competitor_id", "display_name", "score"]]
+
+
+def co_assignees(patents: pd.DataFrame, as_of: date, days: int, names: Dict[str, str]) -> pd.DataFrame:
+    """Other tracked companies sharing a patent_id with the company's in-window patents."""
+    p1 = patents.loc[patents["patent_date"] >= _cutoff(as_of, days), ["company_id", "patent_id"]]
+    p2 = patents[["company_id", "patent_id"]].rename(columns={"company_id": "other_company_id"})
+    m = p1.merge(p2, on="patent_id")
+    m = m[m["company_id"] != m["other_company_id"]]
+
+    agg = m.groupby(["company_id", "other_company_id"])["patent_id"].nunique().reset_index(name="n")
+    agg["display_name"] = agg["other_company_id"].map(names).fillna(agg["other_company_id"])
+    top = _top_per_company(agg, ["n", "display_name"], [False, True], CO_ASSIGNEES_LIMIT)
+    return top.rename(columns={"other_company_id": "co_company_id"})[["company_id", "co_company_id", "display_name", "n"]]
+
+
+def top_inventors(inventors: pd.DataFrame, as_of: date, days: int) -> pd.DataFrame:
+    cur = inventors[(inventors["patent_date"] >= _cutoff(as_of, days)) & (inventors["inventor_name"] != "")]
+    agg = cur.groupby(["company_id", "inventor_name"])["patent_id"].nunique().reset_index(name="n")
+    agg = agg.rename(columns={"inventor_name": "name"})
+    return _top_per_company(agg, ["n", "name"], [False, True], INVENTORS_LIMIT)[["company_id", "name", "n"]]
+
+
+def rows_by_company(df: pd.DataFrame, rename: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+    """{company_id: [row, ...]} in frame order, with JSON-native values (NaN -> null)."""
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    if df.empty:
+        return out
+    owners = df["company_id"].astype(str).tolist()
+    records = json.loads(df.drop(columns=["company_id"]).rename(columns=rename).to_json(orient="records"))
+    for owner, rec in zip(owners, records):
+        out.setdefault(owner, []).append(rec)
+    return out
+
+
+def _read_csv(path: str, columns: List[str]) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    for c in columns:
+        if c not in df.columns:
+            df[c] = ""
+    return df[columns]
+
+
+def load_titles(pg_dir: str) -> Dict[str, Dict[str, str]]:
+    """{level: {code: title}} from the CPC dictionary exports."""
+    group = _read_csv(os.path.join(pg_dir, "cpc_group.csv"), ["cpc_group_id", "cpc_group_title"])
+    sub = _read_csv(os.path.join(pg_dir, "cpc_subclass.csv"), ["cpc_subclass_id", "cpc_subclass_title"])
+    cls = _read_csv(os.path.join(pg_dir, "cpc_class.csv"), ["cpc_class_id", "cpc_class_title"])
+    group_titles = dict(zip(group["cpc_group_id"], group["cpc_group_title"]))
+    return {
+        "group": group_titles,
+        "main_group": group_titles,
+        "subclass": dict(zip(sub["cpc_subclass_id"], sub["cpc_subclass_title"])),
+        "class": dict(zip(cls["cpc_class_id"], cls["cpc_class_title"])),
+    }
+
+
+def build_insight_snapshots(
+    sector_id: str,
+    pg_dir: str,
+    out_public_dir: str,
+    as_of: Optional[date] = None,
+    days_presets: Tuple[int, ...] = INSIGHT_DAYS,
+    levels: Tuple[str, ...] = INSIGHT_LEVELS,
+) -> int:
+    """
+    Precomputes the /api/insights payloads for every tracked company and every preset
+    (days, level) from the Postgres exports, and writes them as gzipped JSON to
+    <out_public_dir>/insights/<companyId>.json.gz. Returns the number of snapshots.
+    """
+    as_of = as_of or date.today()
+
+    patents = _read_csv(
+        os.path.join(pg_dir, f"{sector_id}_patents.csv"), ["company_id", "patent_id", "patent_date", "cpc_group_ids"]
+    )
+    companies = _read_csv(os.path.join(pg_dir, f"{sector_id}_companies.csv"), ["companyId", "displayName"])
+    inventors = _read_csv(
+        os.path.join(pg_dir, f"{sector_id}_inventors.csv"), ["company_id", "patent_id", "inventor_name", "patent_date"]
+    )
+    titles = load_titles(pg_dir)
+    names = dict(zip(companies["companyId"], companies["displayName"]))
+
+    exploded = explode_groups(patents)
+
+    windows: Dict[str, Dict[str, Any]] = {cid: {} for cid in companies["companyId"]}
+    for days in days_presets:
+        comp = rows_by_company(competitors(exploded, as_of, days, names), {"competitor_id": "company_id"})
+        co = rows_by_company(co_assignees(patents, as_of, days, names), {"co_company_id": "company_id"})
+        inv = rows_by_company(top_inventors(inventors, as_of, days), {})
+
+        per_level: Dict[str, Dict[str, Dict[str, List[Dict[str, Any]]]]] = {}
+        for level in levels:
+            per_level[level] = {
+                "topCpc": rows_by_company(top_cpc(exploded, as_of, days, level, titles[level]), {}),
+                "cpcTrend": rows_by_company(cpc_trend(exploded, as_of, days, level, titles[level]), {}),
+            }
+
+        for cid, w in windows.items():
+            w[str(days)] = {
+                "competitors": comp.get(cid, []),
+                "coAssignees": co.get(cid, []),
+                "topInventors": inv.get(cid, []),
+                "levels": {
+                    level: {"topCpc": v["topCpc"].get(cid, []), "cpcTrend": v["cpcTrend"].get(cid, [])}
+                    for level, v in per_level.items()
+                },
+            }
+
+    out_dir = os.path.join(out_public_dir, "insights")
+    os.makedirs(out_dir, exist_ok=True)
+
+    written = set()
+    for cid, w in windows.items():
+        payload = {"sector": sector_id, "companyId": cid, "asOf": as_of.isoformat(), "windows": w}
+        name = f"{cid}.json.gz"
+        raw = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        # mtime=0 keeps the gzip bytes deterministic so unchanged payloads don't churn git
+        with gzip.GzipFile(os.path.join(out_dir, name), "wb", mtime=0) as f:
+            f.write(raw)
+        written.add(name)
+
+    # Drop snapshots of companies that are no longer tracked
+    for path in glob.glob(os.path.join(out_dir, "*.json.gz")):
+        if os.path.basename(path) not in written:
+            os.remove(path)
+
+    return len(written)
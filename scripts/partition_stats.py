@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from store import partition_sources
+
+
+# One sidecar per pairs year, <store_dir>/pairs_<year>.stats.json, keyed by the year's list
+# of live pairs and citation overlay segments (segments are immutable, so the list
+# identifies the content). Windows
+# other than the retention window keep their trimmed boundary year in a tagged sidecar,
+# pairs_<year>.<tag>.stats.json, so it never displaces the shared full-year one.
+#
+# Each holds per-company aggregates for that year only:
+#   patentCount     - unique patents (a patent lives in exactly one year partition)
+#   totalCitations  - sum of cited_by over pair rows
+#   cpcBits         - CPC subclasses as a bitset (hex) over the store's code dictionary
+# so stats for any set of years are a sum / bitwise OR over sidecars.
+CODE_DICT_FILE = "cpc_subclass_codes.json"
+
+STATS_COLUMNS = ["canonical_company_id", "display_name", "patentCount", "totalCitations", "cpcBits"]
+
+
+def load_code_dict(store_dir: str) -> List[str]:
+    path = os.path.join(store_dir, CODE_DICT_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return list(json.load(f))
+
+
+def save_code_dict(store_dir: str, codes: List[str]) -> None:
+    # Append-only: bit positions of existing codes never move, so old sidecars stay valid.
+    with open(os.path.join(store_dir, CODE_DICT_FILE), "w", encoding="utf-8") as f:
+        json.dump(codes, f, indent=0)
+
+
+def _codes_digest(codes: List[str]) -> str:
+    return hashlib.sha1("\n".join(codes).encode("utf-8")).hexdigest()
+
+
+def _sidecar_path(store_dir: str, year: int, tag: str = "") -> str:
+    suffix = f".{tag}" if tag else ""
+    return os.path.join(store_dir, f"pairs_{year}{suffix}.stats.json")
+
+
+def compute_partition_stats(corp: pd.DataFrame, code_index: Dict[str, int], codes: List[str]) -> pd.DataFrame:
+    """
+    corp: corporate pair rows of one partition (see build_artifacts.corporate_pairs).
+    New CPC codes are appended to codes/code_index in place.
+    """
+    if corp.empty:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+
+    keys = ["canonical_company_id", "display_name"]
+    stats = (
+        corp.groupby(keys, dropna=False)
+        .agg(
+            patentCount=("patent_id", "nunique"),
+            totalCitations=("cited_by", "sum"),
+        )
+        .reset_index()
+    )
+
+    exploded = corp[keys + ["cpc_subclass_ids"]].copy()
+    exploded["code"] = exploded["cpc_subclass_ids"].fillna("").astype(str).str.split("|")
+    exploded = exploded.explode("code")
+    exploded["code"] = exploded["code"].str.strip()
+    exploded = exploded[exploded["code"].fillna("") != ""]
+
+    for code in sorted(set(exploded["code"]) - set(code_index)):
+        code_index[code] = len(codes)
+        codes.append(code)
+
+    exploded["bit"] = exploded["code"].map(code_index)
+    bits = (
+        exploded.drop_duplicates(subset=keys + ["bit"])
+        .groupby(keys, dropna=False)["bit"]
+        .agg(lambda s: format(sum(1 << int(b) for b in s), "x"))
+        .rename("cpcBits")
+        .reset_index()
+    )
+    stats = stats.merge(bits, on=keys, how="left")
+    stats["cpcBits"] = stats["cpcBits"].fillna("0")
+    return stats[STATS_COLUMNS]
+
+
+def ensure_partition_stats(
+    store_dir: str,
+    corp_loader: Callable[[int], pd.DataFrame],
+    min_date: str = "",
+    tag: str = "",
+    persist: bool = True,
+) -> Dict[int, pd.DataFrame]:
+    """
+    Returns {year: stats_df} for every pairs year overlapping the window
+    (year >= year(min_date)).
+
+    A year's sidecar is (re)generated only when its set of live segments changed since the
+    sidecar was written, or, for the boundary year, when the window start moved.
+    corp_loader(year) must return the in-window corporate pair rows of that year.
+    tag names a secondary window (e.g. "1y"); its boundary year gets its own sidecar.
+    persist=False only reads valid sidecars: missing or stale ones are computed in memory
+    and nothing in store_dir (sidecars, code dictionary) is written.
+    """
+    codes = load_code_dict(store_dir)
+    code_index = {c: i for i, c in enumerate(codes)}
+    n_codes = len(codes)
+
+    out: Dict[int, pd.DataFrame] = {}
+    min_year = int(min_date[:4]) if min_date else 0
+    for year, source in partition_sources(store_dir, "pairs").items():
+        if year < min_year:
+            continue
+        # Only the boundary year is trimmed by the window, so only its sidecar depends on it
+        cutoff = min_date if year == min_year else ""
+        sidecar = _sidecar_path(store_dir, year, tag if cutoff else "")
+
+        cached = _read_sidecar(sidecar, source, cutoff, codes)
+        if cached is not None:
+            out[year] = cached
+            continue
+
+        stats = compute_partition_stats(corp_loader(year), code_index, codes)
+        out[year] = stats
+        if not persist:
+            continue
+
+        rows = [
+            [r.canonical_company_id, r.display_name, int(r.patentCount), int(r.totalCitations), r.cpcBits]
+            for r in stats.itertuples(index=False)
+        ]
+        with open(sidecar, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "segments": source,
+                    "min_date": cutoff,
+                    # Bit positions are only meaningful against this exact dictionary prefix
+                    "n_codes": len(codes),
+                    "codes_sha1": _codes_digest(codes),
+                    "columns": STATS_COLUMNS,
+                    "rows": rows,
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+    if persist and tag:
+        # A tagged window only ever needs its current boundary year
+        for path in glob.glob(os.path.join(store_dir, f"pairs_*.{tag}.stats.json")):
+            if path != _sidecar_path(store_dir, min_year, tag):
+                os.remove(path)
+
+    if persist and len(codes) != n_codes:
+        save_code_dict(store_dir, codes)
+    return out
+
+
+def _read_sidecar(path: str, source: List[str], cutoff: str, codes: List[str]) -> Optional[pd.DataFrame]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if obj.get("segments") != source or obj.get("min_date", "") != cutoff or obj.get("columns") != STATS_COLUMNS:
+        return None
+    n_codes = int(obj.get("n_codes", -1))
+    if n_codes < 0 or n_codes > len(codes) or obj.get("codes_sha1") != _codes_digest(codes[:n_codes]):
+        return None
+    return pd.DataFrame(obj.get("rows", []), columns=STATS_COLUMNS)
+
+
+def merge_partition_stats(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Merges per-year sidecar stats into the company_stats frame build_sector_artifacts
+    publishes (patentCount, totalCitations, citationsPerPatent, cpcBreadth).
+    """
+    keys = ["canonical_company_id", "display_name"]
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=keys + ["patentCount", "totalCitations", "citationsPerPatent", "cpcBreadth"])
+
+    allp = pd.concat(parts, ignore_index=True)
+    allp["patentCount"] = allp["patentCount"].astype(int)
+    allp["totalCitations"] = allp["totalCitations"].astype(int)
+    allp["cpcBits"] = allp["cpcBits"].astype(str).map(lambda h: int(h, 16))
+
+    company_stats = (
+        allp.groupby(keys, dropna=False)
+        .agg(patentCount=("patentCount", "sum"), totalCitations=("totalCitations", "sum"))
+        .reset_index()
+    )
+    company_stats["citationsPerPatent"] = company_stats.apply(
+        lambda r: (float(r["totalCitations"]) / float(r["patentCount"])) if r["patentCount"] else 0.0, axis=1
+    )
+
+    # Breadth is per canonical company (across display-name variants), like the row-level path
+    def _or_all(bits: pd.Series) -> int:
+        acc = 0
+        for b in bits:
+            acc |= b
+        return acc.bit_count()
+
+    breadth = allp.groupby("canonical_company_id", dropna=False)["cpcBits"].agg(_or_all).rename("cpcBreadth").reset_index()
+    company_stats = company_stats.merge(breadth, on="canonical_company_id", how="left")
+    company_stats["cpcBreadth"] = company_stats["cpcBreadth"].fillna(0).astype(int)
+    return company_stats
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Stage kinds:
+#   "io"  -> network-bound; run one at a time on a single background thread so the
+#            shared PVClient rate limiter sees a serial request stream.
+#   "cpu" -> pandas-heavy; run in a process pool so independent sectors build in parallel.
+IO = "io"
+CPU = "cpu"
+
+
+class PipelineError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    fn: Callable[..., Any]
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    deps: Tuple[str, ...] = ()
+    kind: str = CPU
+
+
+def _validate(stages: List[Stage]) -> Dict[str, Stage]:
+    by_name: Dict[str, Stage] = {}
+    for st in stages:
+        if st.name in by_name:
+            raise PipelineError(f"Duplicate stage name: {st.name}")
+        if st.kind not in (IO, CPU):
+            raise PipelineError(f"Unknown stage kind for {st.name}: {st.kind}")
+        by_name[st.name] = st
+
+    for st in stages:
+        for d in st.deps:
+            if d not in by_name:
+                raise PipelineError(f"Stage {st.name} depends on unknown stage {d}")
+
+    # Cycle check (Kahn)
+    indeg = {st.name: len(st.deps) for st in stages}
+    children: Dict[str, List[str]] = {st.name: [] for st in stages}
+    for st in stages:
+        for d in st.deps:
+            children[d].append(st.name)
+    ready = [n for n, k in indeg.items() if k == 0]
+    seen = 0
+    while ready:
+        n = ready.pop()
+        seen += 1
+        for c in children[n]:
+            indeg[c] -= 1
+            if indeg[c] == 0:
+                ready.append(c)
+    if seen != len(stages):
+        raise PipelineError("Stage graph has a cycle")
+
+    return by_name
+
+
+def run_stages(stages: List[Stage], cpu_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Runs a stage dependency graph. A stage starts as soon as all of its deps have
+    finished, so e.g. fetch(tech) overlaps with suggestions/build(biotech).
+
+    cpu_workers=0 runs every stage inline in dependency order (useful for debugging).
+    Returns {stage_name: result}.
+
+    The first failing stage aborts the run: nothing further is scheduled, queued stages
+    are cancelled and PipelineError is raised right away. A stage already running keeps
+    going in the background (a thread can't be interrupted), so an in-flight crawl still
+    holds the interpreter open until its current request loop returns.
+    """
+    by_name = _validate(stages)
+    results: Dict[str, Any] = {}
+
+    if cpu_workers == 0:
+        pending = list(stages)
+        while pending:
+            st = next(s for s in pending if all(d in results for d in s.deps))
+            pending.remove(st)
+            results[st.name] = _timed(st)
+        return results
+
+    io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-io")
+    # Workers must not be forked from a process whose io thread may be mid-request
+    # (inherited requests/urllib3/SSL locks); forkserver/spawn start them clean.
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    cpu_pool = ProcessPoolExecutor(max_workers=cpu_workers, mp_context=multiprocessing.get_context(method))
+    pools: Dict[str, Executor] = {IO: io_pool, CPU: cpu_pool}
+
+    running: Dict[Future, str] = {}
+    started: set[str] = set()
+    failed = True
+    try:
+        while len(results) < len(by_name):
+            for st in stages:
+                if st.name in started or not all(d in results for d in st.deps):
+                    continue
+                started.add(st.name)
+                print(f"[pipeline] start {st.name} ({st.kind})")
+                running[pools[st.kind].submit(_timed, st)] = st.name
+
+            if not running:
+                raise PipelineError("No runnable stages left (unsatisfiable deps)")
+
+            done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception as e:
+                    raise PipelineError(f"Stage {name} failed: {e}") from e
+        failed = False
+    finally:
+        for fut in running:
+            fut.cancel()
+        if failed and any(not fut.done() for fut in running):
+            print(f"[pipeline] aborting; still running: {', '.join(sorted(running[f] for f in running if not f.done()))}")
+        # On failure don't block on in-flight stages; the error surfaces immediately
+        io_pool.shutdown(wait=not failed, cancel_futures=True)
+        cpu_pool.shutdown(wait=not failed, cancel_futures=True)
+
+    return results
+
+
+def _timed(st: Stage) -> Any:
+    t0 = time.time()
+    out = st.fn(**st.kwargs)
+    print(f"[pipeline] done  {st.name} in {time.time() - t0:.1f}s")
+    return out
@@ -3,7 +3,7 @@ from __future__ import annotations
 import json
 import time
 from dataclasses import dataclass
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import requests
 
@@ -40,10 +40,14 @@ class PVClient:
         s: Optional[List[Dict[str, str]]] = None,
         o: Optional[Dict[str, Any]] = None,
         method: str = "GET",
-    ) -> Dict[str, Any]:
+        decoder: Optional[Callable[[bytes], Any]] = None,
+    ) -> Any:
         """
         Performs a PatentsView PatentSearch API request.
         Query params: q (required), f, s, o. :contentReference[oaicite:5]{index=5}
+
+        With a decoder (e.g. pv_decode.decode_patent_page) the raw response body is handed
+        to it and its result returned instead of the generic dict.
         """
         if not q:
             raise ValueError("q is required and must be a non-empty dict")
@@ -66,7 +70,16 @@ class PVClient:
 
         try:
             if method.upper() == "POST":
-                resp = requests.post(url, headers=headers, json=params, timeout=self.timeout_s)
+                # POST bodies carry q/f/s/o as JSON objects rather than encoded strings,
+                # which lets large patent_id lists through without hitting URL limits.
+                body: Dict[str, Any] = {"q": q}
+                if f is not None:
+                    body["f"] = f
+                if s is not None:
+                    body["s"] = s
+                if o is not None:
+                    body["o"] = o
+                resp = requests.post(url, headers=headers, json=body, timeout=self.timeout_s)
             else:
                 resp = requests.get(url, headers=headers, params=params, timeout=self.timeout_s)
         finally:
@@ -76,6 +89,9 @@ class PVClient:
             reason = resp.headers.get("X-Status-Reason", "")
             raise PVError(f"HTTP {resp.status_code} {resp.text[:300]} {reason}")
 
+        if decoder is not None:
+            return decoder(resp.content)
+
         data = resp.json()
         # 'error' exists in the response schema. :contentReference[oaicite:6]{index=6}
         if str(data.get("error", "false")).lower() == "true":
@@ -91,10 +107,12 @@ class PVClient:
         s: List[Dict[str, str]],
         size: int = 1000,
         method: str = "GET",
-    ) -> Iterable[Dict[str, Any]]:
+        decoder: Optional[Callable[[bytes], Any]] = None,
+    ) -> Iterable[Any]:
         """
         Cursor pagination using o.after, which must match sort fields. :contentReference[oaicite:7]{index=7}
-        Yields each page's full response.
+        Yields each page's full response (or the decoder's page object, which must expose
+        .count, .total_hits and .records).
         """
         after: Optional[Any] = None
         while True:
@@ -102,18 +120,24 @@ class PVClient:
             if after is not None:
                 o["after"] = after
 
-            data = self.request(endpoint=endpoint, q=q, f=f, s=s, o=o, method=method)
+            data = self.request(endpoint=endpoint, q=q, f=f, s=s, o=o, method=method, decoder=decoder)
 
             yield data
 
-            total_hits = int(data.get("total_hits", 0))
-            count = int(data.get("count", 0))
+            if decoder is not None:
+                total_hits = int(data.total_hits)
+                count = int(data.count)
+            else:
+                total_hits = int(data.get("total_hits", 0))
+                count = int(data.get("count", 0))
             if count == 0:
                 break
 
             # Determine response key by endpoint naming convention:
             # e.g., /patent => "patents" per Endpoint Dictionary. :contentReference[oaicite:8]{index=8}
-            if endpoint.strip("/") == "patent":
+            if decoder is not None:
+                records = data.records
+            elif endpoint.strip("/") == "patent":
                 records = data.get("patents", [])
             elif endpoint.strip("/") == "assignee":
                 records = data.get("assignees", [])
@@ -138,11 +162,14 @@ class PVClient:
                 break
 
 
-def _get_by_dotted_path(obj: Dict[str, Any], path: str) -> Any:
+def _get_by_dotted_path(obj: Any, path: str) -> Any:
     cur: Any = obj
     for part in path.split("."):
         if isinstance(cur, dict) and part in cur:
             cur = cur[part]
+        elif not isinstance(cur, dict) and hasattr(cur, part):
+            # typed records from pv_decode
+            cur = getattr(cur, part)
         else:
             return None
     return cur
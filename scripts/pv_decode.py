@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+# orjson is in requirements.txt; the stdlib fallback only keeps ad-hoc environments working.
+try:
+    import orjson
+
+    _loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:  # pragma: no cover - depends on environment
+    _loads = json.loads
+
+from pv_client import PVError
+
+
+class PatentRecord:
+    """
+    One decoded /patent result, already normalized to the values the store writes:
+    stripped strings, citation count as text ("" when missing), CPC codes deduped,
+    sorted and "|"-joined (group ids upper-cased).
+
+    assignees: ((assignee_id, assignee_type, assignee_organization), ...)
+    inventors: ((inventor_id, first, last, full_name), ...)
+    """
+
+    __slots__ = (
+        "patent_id",
+        "patent_date",
+        "patent_title",
+        "cited_by",
+        "cpc_subclass_ids",
+        "cpc_group_ids",
+        "assignees",
+        "inventors",
+    )
+
+    def __init__(
+        self,
+        patent_id: str,
+        patent_date: str,
+        patent_title: str,
+        cited_by: str,
+        cpc_subclass_ids: str,
+        cpc_group_ids: str,
+        assignees: Tuple[Tuple[str, str, str], ...],
+        inventors: Tuple[Tuple[str, str, str, str], ...],
+    ) -> None:
+        self.patent_id = patent_id
+        self.patent_date = patent_date
+        self.patent_title = patent_title
+        self.cited_by = cited_by
+        self.cpc_subclass_ids = cpc_subclass_ids
+        self.cpc_group_ids = cpc_group_ids
+        self.assignees = assignees
+        self.inventors = inventors
+
+
+class PatentPage:
+    __slots__ = ("count", "total_hits", "records")
+
+    def __init__(self, count: int, total_hits: int, records: List[PatentRecord]) -> None:
+        self.count = count
+        self.total_hits = total_hits
+        self.records = records
+
+
+def _joined(codes: List[str]) -> str:
+    # Most patents carry one or two CPC entries; skip the set + sort for the single one
+    if len(codes) == 1:
+        return codes[0]
+    return "|".join(sorted(set(codes)))
+
+
+def _decode_patent(p: Dict[str, Any]) -> PatentRecord:
+    # PatentsView sends these fields as strings or null; only patent_id is coerced defensively
+    # (it is the store key), everything else is stripped as-is.
+    get = p.get
+    patent_id = get("patent_id")
+    if patent_id is not None and not isinstance(patent_id, str):
+        patent_id = str(patent_id)
+    cited_by = get("patent_num_times_cited_by_us_patents")
+
+    subs: List[str] = []
+    groups: List[str] = []
+    for c in get("cpc_current") or ():
+        sub = c.get("cpc_subclass_id")
+        if sub and (sub := sub.strip()):
+            subs.append(sub)
+        grp = c.get("cpc_group_id")
+        if grp and (grp := grp.strip()):
+            groups.append(grp.upper())
+
+    assignees = tuple(
+        (aid, (a.get("assignee_type") or "").strip(), (a.get("assignee_organization") or "").strip())
+        for a in get("assignees") or ()
+        if (aid := (a.get("assignee_id") or "").strip())
+    )
+
+    inventors = []
+    for inv in get("inventors") or ():
+        iid = (inv.get("inventor_id") or "").strip()
+        if iid:
+            first = (inv.get("inventor_name_first") or "").strip()
+            last = (inv.get("inventor_name_last") or "").strip()
+            inventors.append((iid, first, last, f"{first} {last}".strip()))
+
+    return PatentRecord(
+        (patent_id or "").strip(),
+        (get("patent_date") or "").strip(),
+        (get("patent_title") or "").strip(),
+        "" if cited_by is None else str(cited_by),
+        _joined(subs) if subs else "",
+        _joined(groups) if groups else "",
+        assignees,
+        tuple(inventors),
+    )
+
+
+def decode_patent_page(content: bytes) -> PatentPage:
+    """
+    Decoder for PVClient.request/paginate on the /patent endpoint. Only the fields the
+    pipeline projects are read; patents without an ID are dropped.
+    """
+    data = _loads(content)
+    if str(data.get("error", "false")).lower() == "true":
+        raise PVError(f"API returned error=true: {str(data)[:300]}")
+
+    records = [_decode_patent(p) for p in (data.get("patents") or ())]
+
+    return PatentPage(
+        count=int(data.get("count", 0)),
+        total_hits=int(data.get("total_hits", 0)),
+        records=[r for r in records if r.patent_id],
+    )
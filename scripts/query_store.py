@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from build_artifacts import corporate_pairs, tracked_companies
+from build_insights import (
+    INSIGHT_LEVELS,
+    co_assignees,
+    competitor_groups,
+    competitors,
+    cpc_trend,
+    explode_groups,
+    load_titles,
+    rows_by_company,
+    top_cpc,
+    top_inventors,
+)
+from store import list_partitions, load_partitioned_store, retention_start_iso
+
+
+# Bump when the cached frame layout changes
+CACHE_VERSION = 1
+
+PANELS = ("topCpc", "cpcTrend", "competitors", "coAssignees", "topInventors")
+
+# Same clamp as apps/web/app/api/insights/route.ts
+MIN_DAYS = 30
+MAX_DAYS = 3650
+
+
+@dataclass
+class QueryFrames:
+    """
+    The tables /api/insights queries in Postgres, rebuilt from the sector store for the
+    tracked companies (the same set and dedupe rules as the pg exports).
+
+    exploded.code is categorical over the sorted CPC group dictionary and patent dates are
+    datetime64, so window filters and group-bys are vectorized. All frames are sorted by
+    company_id, so one company's rows are a contiguous slice (see _company_rows).
+    """
+
+    sector_id: str
+    patents: pd.DataFrame     # company_id, patent_id, patent_date
+    exploded: pd.DataFrame    # company_id, patent_id, patent_date, code
+    inventors: pd.DataFrame   # company_id, patent_id, inventor_name, patent_date
+    names: Dict[str, str]
+    titles: Dict[str, Dict[str, str]]
+
+
+def _stat(path: str) -> List[Any]:
+    try:
+        st = os.stat(path)
+        return [st.st_size, int(st.st_mtime)]
+    except OSError:
+        return []
+
+
+def _cache_key(store_dir: str, pg_dir: str, min_date: str, top_n: int) -> Dict[str, Any]:
+    # Segments are immutable, but adopted legacy partitions are not, so stat every file
+    segments = {
+        prefix: {
+            str(y): [[os.path.relpath(p, store_dir).replace(os.sep, "/")] + _stat(p) for p in paths]
+            for y, paths in list_partitions(store_dir, prefix).items()
+        }
+        for prefix in ("pairs", "citations", "inventors")
+    }
+    titles = {name: _stat(os.path.join(pg_dir, name)) for name in ("cpc_group.csv", "cpc_subclass.csv", "cpc_class.csv")}
+    return {
+        "version": CACHE_VERSION,
+        "min_date": min_date,
+        "top_n": top_n,
+        "segments": segments,
+        "titles": titles,
+    }
+
+
+def _to_dates(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s, format="%Y-%m-%d", errors="coerce")
+
+
+def _by_company(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values("company_id", kind="mergesort").reset_index(drop=True)
+
+
+def _company_rows(df: pd.DataFrame, company_id: str) -> pd.DataFrame:
+    ids = df["company_id"].to_numpy()
+    lo, hi = ids.searchsorted(company_id, "left"), ids.searchsorted(company_id, "right")
+    return df.iloc[lo:hi]
+
+
+def build_query_frames(sector_id: str, store_dir: str, pg_dir: str, min_date: str, top_n: int) -> QueryFrames:
+    """
+    Reads the store once and derives the query tables. Tracked companies are selected
+    exactly as build_sector_artifacts does, from its partition sidecars where they are
+    current; anything stale is computed in memory, so the store stays untouched.
+    """
+    top = tracked_companies(store_dir, min_date, top_n, persist=False)
+    top_ids = set(top["canonical_company_id"].astype(str))
+    names = dict(zip(top["canonical_company_id"].astype(str), top["display_name"].fillna("").astype(str)))
+
+    pairs = load_partitioned_store(store_dir, "pairs", min_date=min_date)
+    patents = pd.DataFrame(columns=["company_id", "patent_id", "patent_date", "cpc_group_ids"])
+    if not pairs.empty:
+        corp = corporate_pairs(pairs)
+        corp = corp[corp["canonical_company_id"].astype(str).isin(top_ids)]
+        patents = pd.DataFrame(
+            {
+                "company_id": corp["canonical_company_id"].astype(str),
+                "patent_id": corp["patent_id"].astype(str),
+                "patent_date": corp["patent_date"].fillna("").astype(str),
+                "cpc_group_ids": corp["cpc_group_ids"].fillna("").astype(str),
+            }
+        )
+        # Same unique company/patent rows as the pg patents export
+        patents = patents.sort_values(["patent_date", "patent_id", "company_id"], kind="mergesort").drop_duplicates(
+            subset=["company_id", "patent_id"], keep="last"
+        )
+
+    exploded = explode_groups(patents)
+    exploded["code"] = pd.Categorical(exploded["code"], categories=sorted(set(exploded["code"])))
+    exploded["patent_date"] = _to_dates(exploded["patent_date"])
+
+    inv_cols = ["company_id", "patent_id", "inventor_name", "patent_date"]
+    inventors = load_partitioned_store(store_dir, "inventors", min_date=min_date)
+    if inventors.empty:
+        inventors = pd.DataFrame(columns=inv_cols)
+    else:
+        for col in ["canonical_company_id", "patent_id", "inventor_id", "inventor_name", "patent_date"]:
+            if col not in inventors.columns:
+                inventors[col] = ""
+        inventors = inventors[inventors["canonical_company_id"].astype(str).isin(top_ids)].copy()
+        inventors["company_id"] = inventors["canonical_company_id"].astype(str)
+        inventors = inventors.drop_duplicates(subset=["company_id", "patent_id", "inventor_id"])
+        inventors = inventors[inv_cols].fillna("").astype(str)
+    inventors["patent_date"] = _to_dates(inventors["patent_date"])
+
+    patents = patents.drop(columns=["cpc_group_ids"])
+    patents["patent_date"] = _to_dates(patents["patent_date"])
+
+    return QueryFrames(
+        sector_id=sector_id,
+        patents=_by_company(patents),
+        exploded=_by_company(exploded),
+        inventors=_by_company(inventors),
+        names=names,
+        titles=load_titles(pg_dir),
+    )
+
+
+def load_query_frames(
+    sector_id: str,
+    root: str,
+    min_date: str = "",
+    top_n: int = 200,
+    use_cache: bool = True,
+) -> QueryFrames:
+    """
+    QueryFrames for a sector, from data/cache/<sector>/ when the store, window, top_n and
+    CPC title exports are unchanged since it was written; otherwise rebuilt and re-cached.
+    """
+    store_dir = os.path.join(root, "data", "store", sector_id)
+    pg_dir = os.path.join(root, "data", "state", "postgres")
+    cache_dir = os.path.join(root, "data", "cache", sector_id)
+    key_path = os.path.join(cache_dir, "query_frames.json")
+    data_path = os.path.join(cache_dir, "query_frames.pkl")
+
+    key = _cache_key(store_dir, pg_dir, min_date, top_n)
+    if use_cache and os.path.exists(key_path) and os.path.exists(data_path):
+        try:
+            with open(key_path, "r", encoding="utf-8") as f:
+                cached_key = json.load(f)
+            if cached_key == key:
+                with open(data_path, "rb") as f:
+                    return QueryFrames(**pickle.load(f))
+        except (OSError, ValueError, TypeError, pickle.UnpicklingError, EOFError):
+            pass
+
+    frames = build_query_frames(sector_id, store_dir, pg_dir, min_date, top_n)
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(key_path):
+            os.remove(key_path)
+        with open(data_path, "wb") as f:
+            # Plain field dict, so the cache loads whether this module runs as a script or not
+            pickle.dump(dict(vars(frames)), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Key last, so an interrupted write never validates a partial pickle
+        with open(key_path, "w", encoding="utf-8") as f:
+            json.dump(key, f)
+    return frames
+
+
+def query_company(
+    frames: QueryFrames,
+    company_id: str,
+    days: int = 365,
+    level: str = "group",
+    as_of: Optional[date] = None,
+    panels: Tuple[str, ...] = PANELS,
+) -> Dict[str, Any]:
+    """
+    The /api/insights payload for one company. Inputs are narrowed to the rows that can
+    affect this company's answer before running the shared build_insights queries.
+    """
+    if level not in INSIGHT_LEVELS:
+        raise ValueError(f"Invalid level: {level}")
+    as_of = as_of or date.today()
+    days = max(MIN_DAYS, min(MAX_DAYS, int(days)))
+    titles = frames.titles[level]
+
+    ex = frames.exploded
+    mine = _company_rows(ex, company_id)
+    out: Dict[str, Any] = {
+        "sector": frames.sector_id,
+        "companyId": company_id,
+        "asOf": as_of.isoformat(),
+        "days": days,
+        "level": level,
+    }
+
+    if "topCpc" in panels:
+        out["topCpc"] = rows_by_company(top_cpc(mine, as_of, days, level, titles), {}).get(company_id, [])
+    if "cpcTrend" in panels:
+        out["cpcTrend"] = rows_by_company(cpc_trend(mine, as_of, days, level, titles), {}).get(company_id, [])
+    if "competitors" in panels:
+        # Overlap is only ever scored on the company's top groups; select their rows through
+        # the code dictionary rather than comparing strings
+        wanted = np.zeros(len(ex["code"].cat.categories), dtype=bool)
+        wanted[competitor_groups(mine, as_of, days)["code"].cat.codes.to_numpy()] = True
+        shared = ex[wanted[ex["code"].cat.codes.to_numpy()]]
+        comp = competitors(shared, as_of, days, frames.names)
+        out["competitors"] = rows_by_company(comp, {"competitor_id": "company_id"}).get(company_id, [])
+    if "coAssignees" in panels:
+        pats = frames.patents
+        shared = pats[pats["patent_id"].isin(_company_rows(pats, company_id)["patent_id"])]
+        co = co_assignees(shared, as_of, days, frames.names)
+        out["coAssignees"] = rows_by_company(co, {"co_company_id": "company_id"}).get(company_id, [])
+    if "topInventors" in panels:
+        inv = _company_rows(frames.inventors, company_id)
+        out["topInventors"] = rows_by_company(top_inventors(inv, as_of, days), {}).get(company_id, [])
+    return out
+
+
+def list_companies(frames: QueryFrames) -> List[Dict[str, Any]]:
+    counts = frames.patents.groupby("company_id")["patent_id"].nunique()
+    return [
+        {"companyId": cid, "displayName": frames.names.get(cid, cid), "patentCount": int(counts.get(cid, 0))}
+        for cid in sorted(frames.names, key=lambda c: (-int(counts.get(c, 0)), c))
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Company insights (as served by /api/insights) straight from the local sector store."
+    )
+    parser.add_argument("sector", help="sector id, e.g. biotech or tech")
+    parser.add_argument("company", nargs="?", default="", help="company id; omit to list tracked companies")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--level", choices=INSIGHT_LEVELS, default="group")
+    parser.add_argument("--panel", action="append", choices=PANELS, help="repeatable; default all panels")
+    parser.add_argument("--as-of", default="", help="ISO date the windows end at (default today)")
+    parser.add_argument("--window-start", default="", help="ISO date; default the store retention window")
+    parser.add_argument("--top-n", type=int, default=int(os.environ.get("TOP_N_COMPANIES", "200")))
+    parser.add_argument("--no-cache", action="store_true", help="rebuild frames without reading/writing the cache")
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+    t0 = time.perf_counter()
+    frames = load_query_frames(
+        args.sector,
+        root,
+        min_date=args.window_start or retention_start_iso(),
+        top_n=args.top_n,
+        use_cache=not args.no_cache,
+    )
+    t1 = time.perf_counter()
+
+    if args.company:
+        as_of = date.fromisoformat(args.as_of) if args.as_of else None
+        result: Any = query_company(frames, args.company, args.days, args.level, as_of, tuple(args.panel or PANELS))
+    else:
+        result = list_companies(frames)
+    t2 = time.perf_counter()
+
+    json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write("\n")
+    print(f"[query] load {t1 - t0:.3f}s, query {t2 - t1:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
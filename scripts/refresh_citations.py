@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import Dict, List
+
+from dateutil.relativedelta import relativedelta
+
+from build_artifacts import top_company_ids
+from pv_client import PVClient
+from pv_decode import decode_patent_page
+from store import (
+    append_partitioned_store,
+    archive_stale_partitions,
+    load_partitioned_store,
+    retention_start_iso,
+)
+from update_sector import load_last_run, save_last_run
+
+
+# Only two small fields per patent, so one POST can carry a full page worth of IDs.
+CITATION_BATCH_SIZE = 1000
+
+CITED_BY_FIELD = "patent_num_times_cited_by_us_patents"
+
+
+def fetch_citation_counts(client: PVClient, patent_ids: List[str]) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    want = sorted({x for x in patent_ids if x})
+    for i in range(0, len(want), CITATION_BATCH_SIZE):
+        batch = want[i : i + CITATION_BATCH_SIZE]
+        page = client.request(
+            endpoint="patent",
+            q={"patent_id": batch},
+            f=["patent_id", CITED_BY_FIELD],
+            s=[{"patent_id": "asc"}],
+            o={"size": len(batch)},
+            method="POST",
+            decoder=decode_patent_page,
+        )
+        for rec in page.records:
+            if rec.cited_by:
+                out[rec.patent_id] = rec.cited_by
+    return out
+
+
+def refresh_citation_counts(
+    client: PVClient,
+    sector_id: str,
+    store_dir: str,
+    last_run_path: str,
+    top_n: int = 200,
+) -> int:
+    """
+    Citation counts are the only field that changes on already-granted patents, so this
+    refreshes just that column for the tracked companies' patents without a full crawl.
+
+    Only patents whose count changed are appended, as narrow rows of the "citations"
+    overlay that readers apply on top of the pairs. Returns the number of updated patents.
+    """
+    retention_start = retention_start_iso()
+    archive_stale_partitions(store_dir, retention_start)
+
+    pairs = load_partitioned_store(store_dir, "pairs", min_date=retention_start)
+    if pairs.empty:
+        return 0
+
+    top_ids = top_company_ids(pairs, top_n)
+    tracked = pairs["canonical_company_id"].astype(str).isin(top_ids)
+    counts = fetch_citation_counts(client, pairs.loc[tracked, "patent_id"].astype(str).tolist())
+
+    if CITED_BY_FIELD not in pairs.columns:
+        pairs[CITED_BY_FIELD] = ""
+    old = pairs[CITED_BY_FIELD].fillna("").astype(str)
+    new = pairs["patent_id"].astype(str).map(counts).fillna(old)
+    changed = pairs.loc[new != old, ["sector_id", "patent_id", "patent_date"]].assign(**{CITED_BY_FIELD: new})
+    changed = changed.drop_duplicates(subset=["sector_id", "patent_id"])
+
+    n_changed = len(changed)
+    if n_changed:
+        append_partitioned_store(changed, store_dir, "citations")
+
+    last_run = load_last_run(last_run_path)
+    entry = last_run.get(sector_id, {})
+    entry["citations_refreshed_at"] = date.today().isoformat()
+    last_run[sector_id] = entry
+    save_last_run(last_run_path, last_run)
+
+    print(f"[citations] {sector_id}: {len(counts)} patents queried, {n_changed} counts updated")
+    return n_changed
+
+
+def citations_due(last_run_path: str, sector_id: str, every_days: int) -> bool:
+    """True when the sector's citation counts were last refreshed every_days or more ago (or never)."""
+    refreshed = load_last_run(last_run_path).get(sector_id, {}).get("citations_refreshed_at", "")
+    return not refreshed or refreshed <= (date.today() - relativedelta(days=every_days)).isoformat()
@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+import re
+import shutil
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+
+# Store layout (data/store/<sector>/):
+#
+#   manifest.json                         live segments per prefix and grant year, oldest first
+#   segments/<prefix>_<year>_<run>.csv    immutable, sorted by the prefix's key columns
+#   archive/                              segments of years that fell out of the retention window
+#
+# Writers only ever add a segment holding the rows of one run; when several live segments
+# of a year carry the same key, the later one wins. Weekly commits therefore add one small
+# file per touched year plus a manifest update instead of rewriting whole partitions.
+# Pre-manifest stores (<prefix>_<year>.csv) are adopted in place as the first segment.
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_DIR = "segments"
+ARCHIVE_DIR = "archive"
+
+RETENTION_YEARS = 5
+
+STORE_KEYS: Dict[str, List[str]] = {
+    "pairs": ["sector_id", "patent_id", "canonical_company_id", "assignee_id"],
+    "inventors": ["sector_id", "patent_id", "canonical_company_id", "inventor_id"],
+    # (patent, company) combinations whose inventors were requested but none came back
+    "inventor_requests": ["sector_id", "patent_id", "canonical_company_id"],
+    # latest citation count per patent, written by the citation refresh (see OVERLAYS)
+    "citations": ["sector_id", "patent_id"],
+}
+
+# Narrow overlays: {prefix: (overlay prefix, column)}. A refresh of that one column appends
+# only the overlay key and the new value instead of copies of whole rows; readers of the
+# prefix see the overlay's latest value where it has one.
+OVERLAYS: Dict[str, Tuple[str, str]] = {
+    "pairs": ("citations", "patent_num_times_cited_by_us_patents"),
+}
+
+# Compaction merges the trailing run of small segments of a year once there are enough of them.
+# Only a contiguous suffix is merged, so later-segment-wins precedence is preserved. Overlay
+# segments are narrow, so a year's overlay is merged whole, which folds superseded values.
+SMALL_SEGMENT_BYTES = 1 << 20
+COMPACT_MIN_SEGMENTS = 4
+
+# Rows only kept for tracked companies: compaction drops the others from the tails it
+# rewrites, so they leave the hot store without rewriting large segments. Adopted legacy
+# partitions are filtered once, the first time compaction sees them.
+TRACKED_ONLY_PREFIXES = ("inventors", "inventor_requests")
+
+_LEGACY_RE = re.compile(r"^(?P<prefix>[a-z]+)_(?P<year>\d{4})\.csv$")
+
+
+def retention_start_iso() -> str:
+    """
+    First day *excluded* from the rolling retention window (patents must be granted
+    strictly after it, matching the crawl's {"_gt": {"patent_date": start}}).
+    Independent of FAST_MODE's shorter crawl window. RETENTION_START_ISO overrides.
+    """
+    return os.environ.get("RETENTION_START_ISO", "").strip() or (
+        date.today() - relativedelta(years=RETENTION_YEARS)
+    ).isoformat()
+
+
+# ---------- manifest ----------
+
+def load_manifest(store_dir: str) -> Dict[str, Dict[str, List[str]]]:
+    """{prefix: {year: [segment path relative to store_dir, ...]}}"""
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("segments", {})
+
+    # Legacy layout: one mutable CSV per (prefix, year) becomes that year's first segment
+    segments: Dict[str, Dict[str, List[str]]] = {}
+    for p in sorted(glob.glob(os.path.join(store_dir, "*_*.csv"))):
+        m = _LEGACY_RE.match(os.path.basename(p))
+        if m:
+            segments.setdefault(m.group("prefix"), {})[m.group("year")] = [os.path.basename(p)]
+    return segments
+
+
+def save_manifest(store_dir: str, segments: Dict[str, Dict[str, List[str]]]) -> None:
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    cleaned = {p: {y: segs for y, segs in sorted(years.items()) if segs} for p, years in sorted(segments.items())}
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "segments": cleaned}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def list_partitions(store_dir: str, prefix: str) -> Dict[int, List[str]]:
+    """{year: [segment path, ...]} (oldest first) for the live segments of a prefix."""
+    years = load_manifest(store_dir).get(prefix, {})
+    return {int(y): [os.path.join(store_dir, s) for s in segs] for y, segs in sorted(years.items()) if segs}
+
+
+def partition_sources(store_dir: str, prefix: str) -> Dict[int, List[str]]:
+    """
+    {year: [segment path relative to store_dir, ...]} of everything a year of prefix is read
+    from: its live segments, then its overlay's. Identifies the year's content.
+    """
+    segments = load_manifest(store_dir)
+    overlay = segments.get(OVERLAYS[prefix][0], {}) if prefix in OVERLAYS else {}
+    return {int(y): segs + overlay.get(y, []) for y, segs in sorted(segments.get(prefix, {}).items()) if segs}
+
+
+# ---------- reads ----------
+
+def _dedupe(df: pd.DataFrame, prefix: str, keep: str = "last") -> pd.DataFrame:
+    keys = [k for k in STORE_KEYS.get(prefix, []) if k in df.columns]
+    if df.empty or not keys:
+        return df
+    return df.drop_duplicates(subset=keys, keep=keep)
+
+
+def _read_segments(paths: List[str], prefix: str) -> pd.DataFrame:
+    parts = [pd.read_csv(p, dtype=str) for p in paths]
+    if not parts:
+        return pd.DataFrame()
+    if len(parts) == 1:
+        return parts[0]
+    return _dedupe(pd.concat(parts, ignore_index=True), prefix)
+
+
+def filter_window(df: pd.DataFrame, min_date: str) -> pd.DataFrame:
+    """Drops rows granted on or before min_date (used for the boundary-year partition)."""
+    if df.empty or not min_date or "patent_date" not in df.columns:
+        return df
+    return df[df["patent_date"].fillna("").astype(str) > min_date].copy()
+
+
+def _apply_overlay(df: pd.DataFrame, overlay: pd.DataFrame, keys: List[str], column: str) -> pd.DataFrame:
+    if df.empty or overlay.empty:
+        return df
+    latest = overlay.set_index(keys)[column]
+    rows = pd.MultiIndex.from_frame(df[keys].fillna("").astype(str))
+    values = pd.Series(latest.reindex(rows).to_numpy(), index=df.index)
+    df = df.copy()
+    df[column] = values.fillna(df[column]) if column in df.columns else values
+    return df
+
+
+def _read_year(store_dir: str, prefix: str, year: int, paths: List[str]) -> pd.DataFrame:
+    df = _read_segments(paths, prefix)
+    if prefix not in OVERLAYS:
+        return df
+    overlay_prefix, column = OVERLAYS[prefix]
+    overlay = _read_segments(list_partitions(store_dir, overlay_prefix).get(year, []), overlay_prefix)
+    return _apply_overlay(df, overlay, STORE_KEYS[overlay_prefix], column)
+
+
+def load_year(store_dir: str, prefix: str, year: int) -> pd.DataFrame:
+    return _read_year(store_dir, prefix, year, list_partitions(store_dir, prefix).get(year, []))
+
+
+def load_partitioned_store(store_dir: str, prefix: str, min_date: str = "", filter_rows: bool = True) -> pd.DataFrame:
+    """
+    Loads the live segments of the years overlapping the window (year >= year(min_date)).
+    With filter_rows the boundary year is also trimmed to patents after min_date.
+    """
+    min_year = int(min_date[:4]) if min_date else 0
+    parts = [
+        _read_year(store_dir, prefix, y, paths)
+        for y, paths in list_partitions(store_dir, prefix).items()
+        if y >= min_year
+    ]
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame()
+    df = pd.concat(parts, ignore_index=True)
+    return filter_window(df, min_date) if filter_rows else df
+
+
+# ---------- writes ----------
+
+def unseen_rows(df: pd.DataFrame, existing: pd.DataFrame, prefix: str) -> pd.DataFrame:
+    """Rows of df whose key is not present in existing."""
+    keys = STORE_KEYS[prefix]
+    if df.empty or existing.empty or not all(k in existing.columns for k in keys):
+        return df
+    seen = pd.MultiIndex.from_frame(existing[keys].fillna("").astype(str))
+    mask = pd.MultiIndex.from_frame(df[keys].fillna("").astype(str)).isin(seen)
+    return df[~mask]
+
+
+def _run_id() -> str:
+    return os.environ.get("STORE_RUN_ID", "").strip() or date.today().strftime("%Y%m%d")
+
+
+def _write_segment(df: pd.DataFrame, store_dir: str, prefix: str, year: str, run_id: str) -> str:
+    os.makedirs(os.path.join(store_dir, SEGMENTS_DIR), exist_ok=True)
+    name = f"{prefix}_{year}_{run_id}.csv"
+    n = 2
+    while os.path.exists(os.path.join(store_dir, SEGMENTS_DIR, name)):
+        name = f"{prefix}_{year}_{run_id}-{n}.csv"
+        n += 1
+
+    keys = [k for k in STORE_KEYS.get(prefix, []) if k in df.columns]
+    df = df.sort_values(keys, kind="mergesort") if keys else df
+    rel = f"{SEGMENTS_DIR}/{name}"
+    df.to_csv(os.path.join(store_dir, rel), index=False)
+    return rel
+
+
+def append_partitioned_store(df: pd.DataFrame, store_dir: str, prefix: str) -> List[str]:
+    """
+    Adds df's rows as one new immutable segment per grant year and registers them in the
+    manifest. Rows override earlier segments with the same key. Returns the new segments.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    if df.empty:
+        return []
+
+    segments = load_manifest(store_dir)
+    years = segments.setdefault(prefix, {})
+    run_id = _run_id()
+
+    # Within one batch the first row for a key wins (as the pre-segment writers did)
+    df = _dedupe(df, prefix, keep="first").copy()
+    df["year"] = df["patent_date"].astype(str).str.slice(0, 4)
+
+    written: List[str] = []
+    for y, part in df.groupby("year"):
+        rel = _write_segment(part.drop(columns=["year"]), store_dir, prefix, str(y), run_id)
+        years.setdefault(str(y), []).append(rel)
+        written.append(rel)
+
+    save_manifest(store_dir, segments)
+    return written
+
+
+def archive_stale_partitions(store_dir: str, min_date: str) -> List[str]:
+    """
+    Moves the segments (and stats sidecars) of years wholly before the window into
+    <store_dir>/archive/ and drops them from the manifest. Returns the moved file names.
+    """
+    if not min_date:
+        return []
+    min_year = int(min_date[:4])
+    archive = os.path.join(store_dir, ARCHIVE_DIR)
+    segments = load_manifest(store_dir)
+
+    moved: List[str] = []
+    for prefix, years in segments.items():
+        for y in [y for y in years if int(y) < min_year]:
+            for rel in years.pop(y):
+                src = os.path.join(store_dir, rel)
+                if os.path.exists(src):
+                    os.makedirs(archive, exist_ok=True)
+                    shutil.move(src, os.path.join(archive, os.path.basename(rel)))
+                    moved.append(os.path.basename(rel))
+
+    for path in glob.glob(os.path.join(store_dir, "*_*.stats.json")):
+        m = re.match(r"^[a-z]+_(\d{4})\.", os.path.basename(path))
+        if m and int(m.group(1)) < min_year:
+            os.makedirs(archive, exist_ok=True)
+            shutil.move(path, os.path.join(archive, os.path.basename(path)))
+            moved.append(os.path.basename(path))
+
+    if moved:
+        save_manifest(store_dir, segments)
+        print(f"[store] archived {len(moved)} stale files from {store_dir}: {', '.join(moved)}")
+    return moved
+
+
+def _tracked_rows(df: pd.DataFrame, tracked: Set[str]) -> pd.DataFrame:
+    if df.empty or "canonical_company_id" not in df.columns:
+        return df
+    return df[df["canonical_company_id"].astype(str).isin(tracked)]
+
+
+def _prune_legacy_partitions(
+    store_dir: str, prefix: str, tracked: Set[str], segments: Dict[str, Dict[str, List[str]]], run_id: str
+) -> None:
+    # Legacy <prefix>_<year>.csv files predate tracked-only pruning and are usually large, so
+    # tail compaction would never reach them. Each is rewritten in place as a segment once.
+    dropped = 0
+    for y, segs in sorted(segments.get(prefix, {}).items()):
+        for rel in [r for r in segs if not r.startswith(f"{SEGMENTS_DIR}/")]:
+            df = pd.read_csv(os.path.join(store_dir, rel), dtype=str)
+            kept = _tracked_rows(df, tracked)
+            i = segs.index(rel)
+            segs[i : i + 1] = [_write_segment(kept, store_dir, prefix, y, run_id)] if not kept.empty else []
+            save_manifest(store_dir, segments)
+            os.remove(os.path.join(store_dir, rel))
+            dropped += len(df) - len(kept)
+    if dropped:
+        print(f"[store] dropped {dropped} untracked {prefix} rows from legacy partitions in {store_dir}")
+
+
+def compact_store(store_dir: str, prefixes: Optional[List[str]] = None, tracked: Optional[Set[str]] = None) -> int:
+    """
+    Merges, per (prefix, year), the trailing run of small segments into one sorted segment
+    once there are at least COMPACT_MIN_SEGMENTS of them. Large segments are never rewritten,
+    except in overlay prefixes, whose years are merged whole.
+    With tracked, rows of other companies are dropped from rewritten TRACKED_ONLY_PREFIXES tails
+    and, once, from adopted legacy partitions of those prefixes. Returns the number of merged groups.
+    """
+    segments = load_manifest(store_dir)
+    run_id = _run_id()
+    merged = 0
+    overlays = {overlay_prefix for overlay_prefix, _ in OVERLAYS.values()}
+
+    for prefix in prefixes or sorted(segments):
+        if tracked and prefix in TRACKED_ONLY_PREFIXES:
+            _prune_legacy_partitions(store_dir, prefix, tracked, segments, f"{run_id}c")
+        for y, segs in sorted(segments.get(prefix, {}).items()):
+            tail: List[str] = []
+            for rel in reversed(segs):
+                if prefix not in overlays and os.path.getsize(os.path.join(store_dir, rel)) >= SMALL_SEGMENT_BYTES:
+                    break
+                tail.insert(0, rel)
+            if len(tail) < COMPACT_MIN_SEGMENTS:
+                continue
+
+            df = _read_segments([os.path.join(store_dir, r) for r in tail], prefix)
+            if tracked and prefix in TRACKED_ONLY_PREFIXES:
+                df = _tracked_rows(df, tracked)
+            head = segs[: len(segs) - len(tail)]
+            segments[prefix][y] = head + ([_write_segment(df, store_dir, prefix, y, f"{run_id}c")] if not df.empty else [])
+            save_manifest(store_dir, segments)
+            for rel in tail:
+                os.remove(os.path.join(store_dir, rel))
+            merged += 1
+
+    if merged:
+        print(f"[store] compacted {merged} segment groups in {store_dir}")
+    return merged
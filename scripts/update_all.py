@@ -2,16 +2,22 @@ from __future__ import annotations
 
 import os
 from datetime import date
+from typing import List, Optional
 from dateutil.relativedelta import relativedelta
 
+from pipeline import CPU, IO, Stage, run_stages
 from pv_client import PVClient
+from refresh_citations import citations_due, refresh_citation_counts
 from update_sector import (
     SectorConfig,
+    compact_sector_store,
     update_sector_pairs,
     write_normalization_suggestions,
 )
 from build_artifacts import BuildConfig, build_sector_artifacts
+from build_insights import build_insight_snapshots
 from update_cpc_titles import update_cpc_titles
+from store import retention_start_iso
 
 
 def _today_iso() -> str:
@@ -66,44 +72,178 @@ def main() -> None:
         os.environ.pop("WINDOW_END_ISO", None)
         os.environ.pop("TOP_N_COMPANIES", None)
 
+    # Companies published, tracked and kept by compaction. The fast-mode TOP_N_COMPANIES
+    # only narrows which companies' inventors this run fetches; the tracked set stays on
+    # the configured 200 so a fast run never shrinks the outputs or prunes the store.
+    top_n = 200
+    fetch_top_n = int(os.environ.get("TOP_N_COMPANIES", str(top_n)))
+
+    # TWO_PHASE_FETCH=1 (default) => crawl lean patent/assignee fields, then fetch inventors
+    # only for the tracked companies' patents. Set to 0 for the single inventors-inline crawl.
+    two_phase = os.environ.get("TWO_PHASE_FETCH", "1").strip() == "1"
+
+    # CITATIONS_ONLY=1 => no crawl; refresh citation counts of the tracked companies'
+    # stored patents in batched patent_id queries, then rebuild artifacts.
+    citations_only = os.environ.get("CITATIONS_ONLY", "0").strip() == "1"
+
+    # Scheduled (non-fast) runs also refresh citation counts after the fetch once the last
+    # refresh is CITATIONS_REFRESH_DAYS old (default 28); 0 refreshes on every run.
+    citations_every = int(os.environ.get("CITATIONS_REFRESH_DAYS", "28"))
+
+    # Stage graph: fetches are network-bound and share one rate-limited client, so they
+    # run serially on the io lane; suggestions/build are CPU-bound and go to a process
+    # pool. fetch(tech) therefore overlaps with suggestions/build(biotech).
+    stages: List[Stage] = []
+    prev_fetch = ""
     for sector in sectors:
-        store_dir = os.path.join(root, "data", "store", sector.sector_id)
-
-        update_sector_pairs(
-            client=client,
-            sector=sector,
-            assignee_map_path=assignee_map,
-            last_run_path=last_run,
-            out_store_dir=store_dir,
+        sid = sector.sector_id
+        store_dir = os.path.join(root, "data", "store", sid)
+
+        if citations_only:
+            fetch = Stage(
+                name=f"citations:{sid}",
+                fn=refresh_citation_counts,
+                kwargs=dict(
+                    client=client,
+                    sector_id=sid,
+                    store_dir=store_dir,
+                    last_run_path=last_run,
+                    top_n=top_n,
+                ),
+                deps=(prev_fetch,) if prev_fetch else (),
+                kind=IO,
+            )
+        else:
+            fetch = Stage(
+                name=f"fetch:{sid}",
+                fn=update_sector_pairs,
+                kwargs=dict(
+                    client=client,
+                    sector=sector,
+                    assignee_map_path=assignee_map,
+                    last_run_path=last_run,
+                    out_store_dir=store_dir,
+                    two_phase=two_phase,
+                    top_n=fetch_top_n,
+                ),
+                # Chain fetches so the io lane processes sectors in a fixed order
+                deps=(prev_fetch,) if prev_fetch else (),
+                kind=IO,
+            )
+        stages.append(fetch)
+        prev_fetch = fetch.name
+
+        refresh_stage = fetch.name
+        if not citations_only and not fast_mode and citations_due(last_run, sid, citations_every):
+            refresh_stage = f"citations:{sid}"
+            stages.append(
+                Stage(
+                    name=refresh_stage,
+                    fn=refresh_citation_counts,
+                    kwargs=dict(
+                        client=client,
+                        sector_id=sid,
+                        store_dir=store_dir,
+                        last_run_path=last_run,
+                        top_n=top_n,
+                    ),
+                    deps=(fetch.name,),
+                    kind=IO,
+                )
+            )
+            prev_fetch = refresh_stage
+
+        # Assignee strings don't change in a citation refresh, so suggestions stay as they are.
+        if not citations_only:
+            stages.append(
+                Stage(
+                    name=f"suggestions:{sid}",
+                    fn=write_normalization_suggestions,
+                    kwargs=dict(
+                        store_dir=store_dir,
+                        out_md_path=os.path.join(root, "data", "state", f"normalization_suggestions_{sid}.md"),
+                    ),
+                    deps=(fetch.name,),
+                    kind=CPU,
+                )
+            )
+
+        stages.append(
+            Stage(
+                name=f"build:{sid}",
+                fn=build_sector_artifacts,
+                kwargs=dict(
+                    cfg=BuildConfig(
+                        sector_id=sid,
+                        store_dir=store_dir,
+                        out_public_dir=os.path.join(root, "apps", "web", "public", "data", sid),
+                        out_pg_dir=pg_dir,
+                        top_n=top_n,
+                        window_start=retention_start_iso(),
+                    )
+                ),
+                deps=(refresh_stage,),
+                kind=CPU,
+            )
+        )
+
+    # CPC dictionaries: skip or cap in fast mode if desired
+    skip_cpc_titles = os.environ.get("SKIP_CPC_TITLES", "0").strip() == "1"
+    if not (fast_mode and skip_cpc_titles) and not citations_only:
+        stages.append(
+            Stage(
+                name="cpc_titles",
+                fn=update_cpc_titles,
+                kwargs=dict(
+                    client=client,
+                    patents_csv_paths=[
+                        os.path.join(pg_dir, "biotech_patents.csv"),
+                        os.path.join(pg_dir, "tech_patents.csv"),
+                    ],
+                    out_pg_dir=pg_dir,
+                ),
+                deps=tuple(f"build:{s.sector_id}" for s in sectors),
+                kind=IO,
+            )
         )
 
-        write_normalization_suggestions(
-            store_dir=store_dir,
-            out_md_path=os.path.join(root, "data", "state", f"normalization_suggestions_{sector.sector_id}.md"),
+    # Static insights snapshots need the exports and, when they are refreshed, CPC titles
+    has_titles = any(st.name == "cpc_titles" for st in stages)
+    for sector in sectors:
+        sid = sector.sector_id
+        stages.append(
+            Stage(
+                name=f"insights:{sid}",
+                fn=build_insight_snapshots,
+                kwargs=dict(
+                    sector_id=sid,
+                    pg_dir=pg_dir,
+                    out_public_dir=os.path.join(root, "apps", "web", "public", "data", sid),
+                ),
+                deps=(f"build:{sid}",) + (("cpc_titles",) if has_titles else ()),
+                kind=CPU,
+            )
         )
 
-        build_sector_artifacts(
-            BuildConfig(
-                sector_id=sector.sector_id,
-                store_dir=store_dir,
-                out_public_dir=os.path.join(root, "apps", "web", "public", "data", sector.sector_id),
-                out_pg_dir=pg_dir,
+    # Background compaction of small store segments, once nothing else reads the sector store
+    for sector in sectors:
+        sid = sector.sector_id
+        readers = tuple(st.name for st in stages if st.name.endswith(f":{sid}") and st.name != f"compact:{sid}")
+        stages.append(
+            Stage(
+                name=f"compact:{sid}",
+                fn=compact_sector_store,
+                kwargs=dict(store_dir=os.path.join(root, "data", "store", sid), top_n=top_n),
+                deps=readers,
+                kind=CPU,
             )
         )
 
-    # CPC dictionaries: skip or cap in fast mode if desired
-    skip_cpc_titles = os.environ.get("SKIP_CPC_TITLES", "0").strip() == "1"
-    if fast_mode and skip_cpc_titles:
-        return
-
-    update_cpc_titles(
-        client=client,
-        patents_csv_paths=[
-            os.path.join(pg_dir, "biotech_patents.csv"),
-            os.path.join(pg_dir, "tech_patents.csv"),
-        ],
-        out_pg_dir=pg_dir,
-    )
+    # PIPELINE_WORKERS=0 => run stages inline, one after another (old behaviour)
+    workers_env = os.environ.get("PIPELINE_WORKERS", "").strip()
+    cpu_workers: Optional[int] = int(workers_env) if workers_env else None
+
+    run_stages(stages, cpu_workers=cpu_workers)
 
 
 if __name__ == "__main__":
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import json
 import os
-import glob
 from dataclasses import dataclass
 from datetime import date
 from typing import Any, Dict, List, Set, Tuple
@@ -10,8 +9,19 @@ from typing import Any, Dict, List, Set, Tuple
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 
+from build_artifacts import top_company_ids, tracked_company_ids
 from pv_client import PVClient
+from pv_decode import decode_patent_page
 from normalize import load_assignee_map, map_assignee, normalize_name_for_suggestions
+from store import (
+    append_partitioned_store,
+    archive_stale_partitions,
+    compact_store,
+    filter_window,
+    load_partitioned_store,
+    retention_start_iso,
+    unseen_rows,
+)
 
 
 @dataclass(frozen=True)
@@ -45,26 +55,70 @@ def build_cpc_query(prefixes: List[str]) -> Dict[str, Any]:
     return {"_or": [{"_begins": {"cpc_current.cpc_subclass_id": p}} for p in prefixes]}
 
 
-def _load_partitioned_store(store_dir: str, prefix: str) -> pd.DataFrame:
-    files = sorted(glob.glob(os.path.join(store_dir, f"{prefix}_*.csv")))
-    if not files:
-        return pd.DataFrame()
-    parts = [pd.read_csv(f, dtype=str) for f in files]
-    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
-
-
-def _write_partitioned_store(df: pd.DataFrame, store_dir: str, prefix: str) -> None:
-    os.makedirs(store_dir, exist_ok=True)
-    if df.empty:
-        return
+# Phase two of the lean fetch asks for inventors by explicit patent_id lists (POST body).
+INVENTOR_BATCH_SIZE = 1000
+
+INVENTOR_FIELDS = [
+    "inventors.inventor_id",
+    "inventors.inventor_name_first",
+    "inventors.inventor_name_last",
+]
+
+
+def _inventor_row(
+    sector_id: str,
+    company_id: str,
+    patent_id: str,
+    patent_date: str,
+    inv: Tuple[str, str, str, str],
+) -> Dict[str, str]:
+    inv_id, first, last, full = inv
+    return {
+        "sector_id": sector_id,
+        "canonical_company_id": company_id,
+        "patent_id": patent_id,
+        "patent_date": patent_date,
+        "inventor_id": inv_id,
+        "inventor_name_first": first,
+        "inventor_name_last": last,
+        "inventor_name": full,
+    }
 
-    df = df.copy()
-    df["year"] = df["patent_date"].astype(str).str.slice(0, 4)
 
-    for y, part in df.groupby("year"):
-        out = os.path.join(store_dir, f"{prefix}_{y}.csv")
-        part = part.drop(columns=["year"])
-        part.to_csv(out, index=False)
+def fetch_inventor_rows(
+    client: PVClient,
+    sector_id: str,
+    targets: Dict[str, Tuple[str, List[str]]],
+) -> List[Dict[str, str]]:
+    """
+    Phase two of the lean fetch.
+    targets: {patent_id: (patent_date, [canonical_company_id, ...])}
+    Queries the patent endpoint in batched patent_id lists and returns inventor store rows
+    for exactly the requested (patent, company) combinations.
+    """
+    rows: List[Dict[str, str]] = []
+    want = sorted(targets.keys())
+    fields = ["patent_id"] + INVENTOR_FIELDS
+
+    for i in range(0, len(want), INVENTOR_BATCH_SIZE):
+        batch = want[i : i + INVENTOR_BATCH_SIZE]
+        page = client.request(
+            endpoint="patent",
+            q={"patent_id": batch},
+            f=fields,
+            s=[{"patent_id": "asc"}],
+            o={"size": len(batch)},
+            method="POST",
+            decoder=decode_patent_page,
+        )
+        for rec in page.records:
+            if rec.patent_id not in targets:
+                continue
+            patent_date, company_ids = targets[rec.patent_id]
+            for company_id in company_ids:
+                for inv in rec.inventors:
+                    rows.append(_inventor_row(sector_id, company_id, rec.patent_id, patent_date, inv))
+    return rows
 
 
 def update_sector_pairs(
@@ -73,17 +127,34 @@ def update_sector_pairs(
     assignee_map_path: str,
     last_run_path: str,
     out_store_dir: str,
+    two_phase: bool = False,
+    top_n: int = 200,
 ) -> None:
+    """
+    two_phase=False: one crawl of the window with inventors inlined on every patent.
+    two_phase=True:  crawl lean patent/assignee fields only, rank companies, then fetch
+                     inventors in patent_id batches for the top_n tracked companies only.
+    """
     os.makedirs(out_store_dir, exist_ok=True)
 
-    existing_pairs = _load_partitioned_store(out_store_dir, "pairs")
-    existing_inventors = _load_partitioned_store(out_store_dir, "inventors")
+    # Years that fell out of the retention window leave the hot path before anything loads.
+    # The boundary year is kept whole on disk; readers trim it to the window.
+    retention_start = retention_start_iso()
+    archive_stale_partitions(out_store_dir, retention_start)
+
+    existing_pairs = load_partitioned_store(out_store_dir, "pairs", min_date=retention_start, filter_rows=False)
+    existing_inventors = load_partitioned_store(out_store_dir, "inventors", min_date=retention_start, filter_rows=False)
+    existing_requests = load_partitioned_store(
+        out_store_dir, "inventor_requests", min_date=retention_start, filter_rows=False
+    )
 
     last_run = load_last_run(last_run_path)
 
     # ✅ Allow overrides for fast mode
     today = os.environ.get("WINDOW_END_ISO", "").strip() or _today_iso()
     start_date = os.environ.get("WINDOW_START_ISO", "").strip() or _five_years_ago_iso()
+    # Never crawl what retention would archive again on the next run
+    start_date = max(start_date, retention_start)
 
     fields = [
         "patent_id",
@@ -95,10 +166,9 @@ def update_sector_pairs(
         "assignees.assignee_id",
         "assignees.assignee_organization",
         "assignees.assignee_type",
-        "inventors.inventor_id",
-        "inventors.inventor_name_first",
-        "inventors.inventor_name_last",
     ]
+    if not two_phase:
+        fields += INVENTOR_FIELDS
     sort = [{"patent_date": "asc"}, {"patent_id": "asc"}]
 
     q: Dict[str, Any] = {
@@ -114,51 +184,17 @@ def update_sector_pairs(
 
     new_pair_rows: List[Dict[str, str]] = []
     new_inv_rows: List[Dict[str, str]] = []
+    targets: Dict[str, Tuple[str, List[str]]] = {}
 
     seen_new_pairs: Set[Tuple[str, str, str]] = set()
     seen_new_invs: Set[Tuple[str, str, str]] = set()
 
-    for page in client.paginate(endpoint="patent", q=q, f=fields, s=sort, size=1000):
-        patents = page.get("patents", []) or []
-        if not patents:
-            continue
-
-        for p in patents:
-            patent_id = str(p.get("patent_id", "")).strip()
-            if not patent_id:
-                continue
-
-            patent_date = (p.get("patent_date") or "").strip()
-            patent_title = (p.get("patent_title") or "").strip()
-            cited_by = p.get("patent_num_times_cited_by_us_patents")
-            cited_by_str = "" if cited_by is None else str(cited_by)
-
-            cpcs = p.get("cpc_current", []) or []
-            cpc_subs = sorted({(c.get("cpc_subclass_id") or "").strip() for c in cpcs if c.get("cpc_subclass_id")})
-            cpc_groups = sorted({(c.get("cpc_group_id") or "").strip().upper() for c in cpcs if c.get("cpc_group_id")})
-
-            cpc_subs_str = "|".join([x for x in cpc_subs if x])
-            cpc_groups_str = "|".join([x for x in cpc_groups if x])
-
-            inventors = p.get("inventors", []) or []
-            inv_norm: List[Tuple[str, str, str, str]] = []
-            for inv in inventors:
-                inv_id = (inv.get("inventor_id") or "").strip()
-                if not inv_id:
-                    continue
-                first = (inv.get("inventor_name_first") or "").strip()
-                last = (inv.get("inventor_name_last") or "").strip()
-                full = (f"{first} {last}").strip()
-                inv_norm.append((inv_id, first, last, full))
-
-            for a in (p.get("assignees", []) or []):
-                assignee_id = (a.get("assignee_id") or "").strip()
-                if not assignee_id:
-                    continue
-
-                assignee_type = (a.get("assignee_type") or "").strip()
-                assignee_org = (a.get("assignee_organization") or "").strip()
+    for page in client.paginate(endpoint="patent", q=q, f=fields, s=sort, size=1000, decoder=decode_patent_page):
+        for rec in page.records:
+            patent_id = rec.patent_id
+            inv_norm = () if two_phase else rec.inventors
 
+            for assignee_id, assignee_type, assignee_org in rec.assignees:
                 canonical_company_id, display_name = map_assignee(
                     assignee_id=assignee_id,
                     raw_org_name=assignee_org,
@@ -174,11 +210,11 @@ def update_sector_pairs(
                     {
                         "sector_id": sector.sector_id,
                         "patent_id": patent_id,
-                        "patent_date": patent_date,
-                        "patent_title": patent_title,
-                        "patent_num_times_cited_by_us_patents": cited_by_str,
-                        "cpc_subclass_ids": cpc_subs_str,
-                        "cpc_group_ids": cpc_groups_str,
+                        "patent_date": rec.patent_date,
+                        "patent_title": rec.patent_title,
+                        "patent_num_times_cited_by_us_patents": rec.cited_by,
+                        "cpc_subclass_ids": rec.cpc_subclass_ids,
+                        "cpc_group_ids": rec.cpc_group_ids,
                         "assignee_id": assignee_id,
                         "assignee_type": assignee_type,
                         "assignee_organization": assignee_org,
@@ -187,43 +223,105 @@ def update_sector_pairs(
                     }
                 )
 
-                for inv_id, first, last, full in inv_norm:
-                    ikey = (patent_id, canonical_company_id, inv_id)
+                for inv in inv_norm:
+                    ikey = (patent_id, canonical_company_id, inv[0])
                     if ikey in seen_new_invs:
                         continue
                     seen_new_invs.add(ikey)
 
                     new_inv_rows.append(
-                        {
-                            "sector_id": sector.sector_id,
-                            "canonical_company_id": canonical_company_id,
-                            "patent_id": patent_id,
-                            "patent_date": patent_date,
-                            "inventor_id": inv_id,
-                            "inventor_name_first": first,
-                            "inventor_name_last": last,
-                            "inventor_name": full,
-                        }
+                        _inventor_row(sector.sector_id, canonical_company_id, patent_id, rec.patent_date, inv)
                     )
 
+    # Stored rows win over re-crawled ones (citation counts have their own refresh stage),
+    # so only keys the store hasn't seen yet go into this run's segment.
+    combined = existing_pairs
     if new_pair_rows:
-        new_pairs_df = pd.DataFrame(new_pair_rows)
+        new_pairs_df = unseen_rows(
+            filter_window(pd.DataFrame(new_pair_rows), retention_start), existing_pairs, "pairs"
+        )
         combined = pd.concat([existing_pairs, new_pairs_df], ignore_index=True) if not existing_pairs.empty else new_pairs_df
-        combined.drop_duplicates(subset=["sector_id", "patent_id", "canonical_company_id", "assignee_id"], inplace=True)
-        _write_partitioned_store(combined, out_store_dir, "pairs")
+        append_partitioned_store(new_pairs_df, out_store_dir, "pairs")
+
+    if two_phase and not combined.empty:
+        # Phase two: inventors only for patents of the companies the build will track,
+        # skipping (patent, company) combinations already requested. Patents without any
+        # inventors leave no inventor rows, so the request log is what marks them as done;
+        # inventor rows still count for stores written before the log existed.
+        in_window = filter_window(combined, retention_start)
+        top_ids = top_company_ids(in_window, top_n)
+
+        have: Set[Tuple[str, str]] = set()
+        for df in (existing_inventors, existing_requests):
+            if not df.empty:
+                have.update(zip(df["patent_id"].astype(str), df["canonical_company_id"].astype(str)))
+
+        tracked = in_window[in_window["canonical_company_id"].astype(str).isin(top_ids)]
+        for patent_id, patent_date, company_id in zip(
+            tracked["patent_id"].astype(str),
+            tracked["patent_date"].fillna("").astype(str),
+            tracked["canonical_company_id"].astype(str),
+        ):
+            if (patent_id, company_id) in have:
+                continue
+            entry = targets.setdefault(patent_id, (patent_date, []))
+            if company_id not in entry[1]:
+                entry[1].append(company_id)
 
-    if new_inv_rows:
-        new_inv_df = pd.DataFrame(new_inv_rows)
-        combined_inv = pd.concat([existing_inventors, new_inv_df], ignore_index=True) if not existing_inventors.empty else new_inv_df
-        combined_inv.drop_duplicates(subset=["sector_id", "patent_id", "canonical_company_id", "inventor_id"], inplace=True)
-        _write_partitioned_store(combined_inv, out_store_dir, "inventors")
+        new_inv_rows = fetch_inventor_rows(client, sector.sector_id, targets)
 
-    last_run[sector.sector_id] = {"refreshed_at": today, "window_start": start_date, "window_end": today}
+    if new_inv_rows:
+        append_partitioned_store(
+            unseen_rows(filter_window(pd.DataFrame(new_inv_rows), retention_start), existing_inventors, "inventors"),
+            out_store_dir,
+            "inventors",
+        )
+
+    # Only combinations that came back without inventors are logged: the others are marked
+    # by their own rows, so pruning those rows also makes them due again. Logged after the
+    # inventor rows are stored, so a failed fetch is retried next run.
+    if two_phase and targets:
+        found = {(str(r["patent_id"]), str(r["canonical_company_id"])) for r in new_inv_rows}
+        append_partitioned_store(
+            pd.DataFrame(
+                [
+                    {
+                        "sector_id": sector.sector_id,
+                        "patent_id": patent_id,
+                        "patent_date": patent_date,
+                        "canonical_company_id": company_id,
+                    }
+                    for patent_id, (patent_date, company_ids) in targets.items()
+                    for company_id in company_ids
+                    if (patent_id, company_id) not in found
+                ]
+            ),
+            out_store_dir,
+            "inventor_requests",
+        )
+
+    entry = {"refreshed_at": today, "window_start": start_date, "window_end": today}
+    # The citation refresh stage schedules itself off this
+    citations_refreshed_at = last_run.get(sector.sector_id, {}).get("citations_refreshed_at")
+    if citations_refreshed_at:
+        entry["citations_refreshed_at"] = citations_refreshed_at
+    last_run[sector.sector_id] = entry
     save_last_run(last_run_path, last_run)
 
 
+def compact_sector_store(store_dir: str, top_n: int = 200) -> int:
+    """
+    Compaction stage, run after the build. Inventor rows and inventor_requests entries of
+    companies that left the top_n are dropped from the tails compaction rewrites. Either
+    one is all that marks a combination as fetched, so whatever is dropped is fetched
+    again if the company re-enters.
+    """
+    tracked = tracked_company_ids(store_dir, retention_start_iso(), top_n)
+    return compact_store(store_dir, tracked=tracked)
+
+
 def write_normalization_suggestions(store_dir: str, out_md_path: str) -> None:
-    df = _load_partitioned_store(store_dir, "pairs")
+    df = load_partitioned_store(store_dir, "pairs", min_date=retention_start_iso())
     if df.empty:
         return
 